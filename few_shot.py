@@ -2,34 +2,160 @@
 Few-Shot Retrieval Module
 Loads processed posts and retrieves matching examples for few-shot learning.
 """
+import functools
 import json
 import os
+import numpy as np
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the stdlib parser
+    orjson = None
+
 # Path to processed posts
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 PROCESSED_POSTS_PATH = os.path.join(DATA_DIR, "processed_posts.json")
+# Columnar sidecar of the processed posts, rebuilt whenever the JSON changes
+PROCESSED_PARQUET_PATH = os.path.join(DATA_DIR, "processed_posts.parquet")
+# Dataset summary precomputed by preprocess.py
+PROCESSED_SUMMARY_PATH = os.path.join(DATA_DIR, "processed_summary.json")
+
+# Fields of a processed post, in column order
+POST_COLUMNS = ["text", "language", "line_count", "engagement", "tags"]
+
+# Length categories, shortest first
+LENGTH_CATEGORIES = ("Short", "Medium", "Long")
 
 
 def load_posts() -> pd.DataFrame:
-    """Load processed posts into a Pandas DataFrame."""
+    """
+    Load processed posts into a Pandas DataFrame.
+    
+    The frame is cached per file version (keyed on modification time), so
+    repeated calls are free until the processed posts file changes.
+    Callers must treat the returned frame as read-only.
+    """
+    df, _ = _load_dataset()
+    return df
+
+
+def _load_dataset() -> tuple:
+    """Return the cached (posts DataFrame, tag index) pair for the current file."""
     if not os.path.exists(PROCESSED_POSTS_PATH):
         raise FileNotFoundError(
             f"Processed posts not found at {PROCESSED_POSTS_PATH}. "
             "Please run 'python preprocess.py' first."
         )
     
-    with open(PROCESSED_POSTS_PATH, "r", encoding="utf-8") as f:
-        posts = json.load(f)
+    mtime = os.path.getmtime(PROCESSED_POSTS_PATH)
+    return _load_dataset_cached(PROCESSED_POSTS_PATH, mtime)
+
+
+def _read_json(path: str):
+    """Parse a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     
-    df = pd.DataFrame(posts)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data):
+    """Write a JSON file with the same serializer _read_json() parses it with."""
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+@functools.lru_cache(maxsize=1)
+def _load_dataset_cached(path: str, mtime: float) -> tuple:
+    """Parse the processed posts file; `mtime` is only part of the cache key."""
+    df = _read_posts_parquet(mtime)
+    
+    if df is None:
+        df = _build_posts_frame(_read_json(path))
+        _write_posts_parquet(df)
+    
+    # Inverted index: tag -> row positions of the posts carrying it
+    tag_index = {}
+    for position, tags in enumerate(df["tags"]):
+        if isinstance(tags, list):
+            for tag in dict.fromkeys(tags):
+                tag_index.setdefault(tag, []).append(position)
+    
+    return df, tag_index
+
+
+def _build_posts_frame(posts: list) -> pd.DataFrame:
+    """Build the posts DataFrame (with derived columns) from parsed JSON records."""
+    # Explicit columns and dtypes skip per-column type inference; the
+    # low-cardinality filter columns are categoricals, so equality filters
+    # and value_counts work on small integer codes instead of Python strings
+    df = pd.DataFrame.from_records(posts, columns=POST_COLUMNS)
+    # A null engagement would make the integer cast fail; count it as zero
+    df["engagement"] = df["engagement"].fillna(0)
+    df = df.astype({
+        "line_count": "int32",
+        "engagement": "int32",
+        "language": "category"
+    })
     
-    # Add length category
-    df["length_category"] = df["line_count"].apply(categorize_length)
+    # Add length category (vectorized equivalent of categorize_length)
+    line_counts = df["line_count"].to_numpy()
+    df["length_category"] = pd.Categorical(
+        np.select(
+            [line_counts < 5, line_counts <= 10],
+            ["Short", "Medium"],
+            default="Long"
+        ),
+        categories=LENGTH_CATEGORIES
+    )
     
     return df
 
 
+def _read_posts_parquet(json_mtime: float):
+    """
+    Load the Parquet sidecar if it is at least as new as the JSON file.
+    
+    Returns:
+        pd.DataFrame or None: The posts frame, or None if the sidecar is
+        missing, stale, or cannot be read (e.g. pyarrow is not installed)
+    """
+    if not os.path.exists(PROCESSED_PARQUET_PATH):
+        return None
+    if os.path.getmtime(PROCESSED_PARQUET_PATH) < json_mtime:
+        return None
+    
+    try:
+        df = pd.read_parquet(PROCESSED_PARQUET_PATH)
+    except (ImportError, OSError, ValueError):
+        return None
+    
+    # Parquet round-trips list columns as arrays; restore plain lists
+    df["tags"] = [list(tags) if tags is not None else [] for tags in df["tags"]]
+    
+    return df
+
+
+def _write_posts_parquet(df: pd.DataFrame):
+    """Best-effort write of the Parquet sidecar; skipped if pyarrow is missing."""
+    tmp_path = PROCESSED_PARQUET_PATH + ".tmp"
+    try:
+        df.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, PROCESSED_PARQUET_PATH)
+    except (ImportError, OSError, TypeError, ValueError) as e:
+        print(f"Skipping Parquet cache ({e})")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 def categorize_length(line_count: int) -> str:
     """
     Categorize post length based on line count.
@@ -53,16 +179,9 @@ def get_tags() -> list:
     Returns:
         list: Sorted list of unique tag names
     """
-    df = load_posts()
-    
-    # Flatten all tags from all posts
-    all_tags = []
-    for tags in df["tags"]:
-        if isinstance(tags, list):
-            all_tags.extend(tags)
-    
-    # Return unique sorted tags
-    return sorted(set(all_tags))
+    # The inverted index already holds every unique tag as a key
+    _, tag_index = _load_dataset()
+    return sorted(tag_index)
 
 
 def get_languages() -> list:
@@ -73,7 +192,8 @@ def get_languages() -> list:
         list: List of unique languages
     """
     df = load_posts()
-    return sorted(df["language"].unique().tolist())
+    # Posts preprocessed without metadata enrichment have no language
+    return sorted(df["language"].dropna().unique().tolist())
 
 
 def get_length_categories() -> list:
@@ -83,7 +203,7 @@ def get_length_categories() -> list:
     Returns:
         list: ["Short", "Medium", "Long"]
     """
-    return ["Short", "Medium", "Long"]
+    return list(LENGTH_CATEGORIES)
 
 
 def get_filtered_posts(
@@ -104,64 +224,162 @@ def get_filtered_posts(
     Returns:
         list: List of matching post dictionaries
     """
-    df = load_posts()
+    df, top = _select_top_posts(length, language, tag, max_results)
+    results = df.iloc[top].to_dict("records")
+    
+    return results
+
+
+def get_filtered_post_texts(
+    length: str = None,
+    language: str = None,
+    tag: str = None,
+    max_results: int = 3
+) -> list:
+    """
+    Retrieve only the text of posts matching the specified criteria.
+    
+    Same selection as get_filtered_posts(), without building a dictionary
+    per post.
+    
+    Returns:
+        list: List of matching post texts, best example first
+    """
+    df, top = _select_top_posts(length, language, tag, max_results)
+    return df["text"].to_numpy()[top].tolist()
+
+
+def _select_top_posts(length: str, language: str, tag: str, max_results: int) -> tuple:
+    """
+    Apply the filters (relaxing them if nothing matches) and rank by engagement.
+    
+    Returns:
+        tuple: (filtered DataFrame, positions of the top posts within it)
+    """
+    base, tag_index = _load_dataset()
+    
+    # Build one combined mask against the cached frame, then index once
+    mask = np.ones(len(base), dtype=bool)
     
-    # Apply filters
     if length:
-        df = df[df["length_category"] == length]
+        mask &= np.asarray(base["length_category"] == length)
     
     if language:
-        df = df[df["language"] == language]
+        mask &= np.asarray(base["language"] == language)
     
     if tag:
-        # Filter posts that contain the specified tag
-        df = df[df["tags"].apply(lambda tags: tag in tags if isinstance(tags, list) else False)]
+        mask &= _tag_mask(tag_index, tag, len(base))
+    
+    df = base[mask]
     
     # If no exact matches, try relaxing filters
     if len(df) == 0:
         print(f"No exact matches for length={length}, language={language}, tag={tag}")
         print("Relaxing filters to find similar posts...")
         
-        # Reload and try with just the tag
-        df = load_posts()
+        # Re-filter the already loaded frame with just the tag
+        df = base
         if tag:
-            df = df[df["tags"].apply(lambda tags: tag in tags if isinstance(tags, list) else False)]
+            df = base[_tag_mask(tag_index, tag, len(base))]
         
         # If still no matches, return any posts
         if len(df) == 0:
-            df = load_posts()
+            df = base
     
-    # Sort by engagement (higher engagement = better examples)
-    df = df.sort_values("engagement", ascending=False)
+    # Pick the top posts by engagement (higher engagement = better examples)
+    # with a partial sort: only the k winners get fully ordered
+    top = _top_k_positions(df["engagement"].to_numpy(), max_results)
     
-    # Take top results
-    results = df.head(max_results).to_dict("records")
+    return df, top
+
+
+def _top_k_positions(values: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the `k` largest values, in descending order of value."""
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
     
-    return results
+    negated = -values
+    top = np.argpartition(negated, k - 1)[:k]
+    return top[np.argsort(negated[top], kind="stable")]
+
+
+def _tag_mask(tag_index: dict, tag: str, n_rows: int) -> np.ndarray:
+    """Boolean row mask of posts carrying `tag`, built from the inverted index."""
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[tag_index.get(tag, [])] = True
+    return mask
 
 
 def get_post_summary(df: pd.DataFrame = None) -> dict:
     """
     Get a summary of the processed posts dataset.
     
+    Without an explicit frame, the summary written by preprocess.py is
+    served from its JSON sidecar as long as it is up to date.
+    
     Returns:
         dict: Summary statistics
     """
     if df is None:
+        summary = _read_post_summary()
+        if summary is not None:
+            return summary
         df = load_posts()
     
     summary = {
         "total_posts": len(df),
-        "languages": df["language"].value_counts().to_dict(),
-        "length_categories": df["length_category"].value_counts().to_dict(),
+        "languages": _counts_to_dict(df["language"].value_counts()),
+        "length_categories": _counts_to_dict(df["length_category"].value_counts()),
         "tags": get_tags(),
-        "avg_engagement": df["engagement"].mean(),
-        "avg_line_count": df["line_count"].mean()
+        # The mean of an empty dataset is NaN, which is not valid JSON
+        "avg_engagement": float(df["engagement"].mean()) if len(df) else 0.0,
+        "avg_line_count": float(df["line_count"].mean()) if len(df) else 0.0
     }
     
     return summary
 
 
+def save_post_summary() -> dict:
+    """
+    Compute the dataset summary and write it to the JSON sidecar.
+    
+    Returns:
+        dict: Summary statistics that were written
+    """
+    summary = get_post_summary(load_posts())
+    _write_json(PROCESSED_SUMMARY_PATH, summary)
+    
+    return summary
+
+
+def _counts_to_dict(counts: pd.Series) -> dict:
+    """
+    Convert value_counts() output to a JSON-serializable dict.
+    
+    Categorical columns also count unused categories; those zeros are dropped.
+    """
+    return {str(key): int(count) for key, count in counts.items() if count}
+
+
+def _read_post_summary():
+    """Return the precomputed summary, or None if it is missing or stale."""
+    if not os.path.exists(PROCESSED_SUMMARY_PATH) or not os.path.exists(PROCESSED_POSTS_PATH):
+        return None
+    
+    mtime = os.path.getmtime(PROCESSED_SUMMARY_PATH)
+    if mtime < os.path.getmtime(PROCESSED_POSTS_PATH):
+        return None
+    
+    return dict(_read_post_summary_cached(PROCESSED_SUMMARY_PATH, mtime))
+
+
+@functools.lru_cache(maxsize=1)
+def _read_post_summary_cached(path: str, mtime: float) -> dict:
+    """Parse the summary sidecar; `mtime` is only part of the cache key."""
+    return _read_json(path)
+
+
 if __name__ == "__main__":
     # Test the module
     print("=== Few-Shot Module Test ===\n")
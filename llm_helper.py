@@ -2,24 +2,55 @@
 LLM Helper Module
 Initializes the Groq LLM with Llama model
 """
+import functools
 import os
+import threading
+import httpx
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 
 # Load environment variables from .env file
 load_dotenv()
 
-def get_llm(model_name: str = None):
+# Use llama-3.3-70b-versatile as default (current recommended model)
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+
+def get_llm(model_name: str = None, pool_size: int = None):
     """
     Initialize and return a ChatGroq LLM instance.
     
+    Instances are cached per model name, so repeated calls share one client
+    (and its HTTP connection pool) instead of rebuilding it on every request.
+    
     Args:
         model_name: Optional model name override. 
                    Defaults to llama-3.3-70b-versatile.
+        pool_size: Optional number of keep-alive connections for concurrent
+                   use. Creates a fresh, uncached instance with its own
+                   sync and async pools, since async connections are tied to
+                   the event loop that opened them. Close it with
+                   aclose_llm() when done.
     
     Returns:
         ChatGroq: Configured LLM instance
     """
+    # Resolve the default first, so it shares a cache entry with explicit requests
+    if model_name is None:
+        model_name = DEFAULT_MODEL
+    
+    if pool_size is None:
+        return _get_cached_llm(model_name)
+    return _create_llm(model_name, pool_size)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_cached_llm(model_name: str):
+    """Create the shared LLM instance for a model (once)."""
+    return _create_llm(model_name)
+
+
+def _create_llm(model_name: str, pool_size: int = None):
+    """Create a ChatGroq instance, optionally with sized connection pools."""
     api_key = os.getenv("GROQ_API_KEY")
     
     if not api_key or api_key == "gsk_your_actual_api_key_here":
@@ -28,28 +59,53 @@ def get_llm(model_name: str = None):
             "Get your free API key at https://console.groq.com/"
         )
     
-    # Use llama-3.3-70b-versatile as default (current recommended model)
-    if model_name is None:
-        model_name = "llama-3.3-70b-versatile"
+    client_kwargs = {}
+    if pool_size is not None:
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size
+        )
+        client_kwargs["http_client"] = httpx.Client(limits=limits, timeout=60)
+        client_kwargs["http_async_client"] = httpx.AsyncClient(limits=limits, timeout=60)
     
     llm = ChatGroq(
         api_key=api_key,
         model_name=model_name,
         temperature=0.7,
-        max_tokens=1024
+        max_tokens=1024,
+        **client_kwargs
     )
     
     return llm
 
 
+async def aclose_llm(llm):
+    """
+    Close the connection pools of an instance created with pool_size.
+    
+    Must be awaited on the event loop that used the instance, since the
+    async pool is bound to it.
+    
+    Args:
+        llm: ChatGroq instance returned by get_llm(pool_size=...)
+    """
+    if llm.http_async_client is not None:
+        await llm.http_async_client.aclose()
+    if llm.http_client is not None:
+        llm.http_client.close()
+
+
+@functools.lru_cache(maxsize=1)
 def get_llm_with_fallback():
     """
     Try primary model first, fallback to alternative if unavailable.
     
+    The primary model is probed once per process; the chosen instance is cached.
+    
     Returns:
         ChatGroq: Configured LLM instance
     """
-    primary_model = "llama-3.3-70b-versatile"
+    primary_model = DEFAULT_MODEL
     fallback_model = "llama-3.1-70b-versatile"
     
     try:
@@ -61,6 +117,31 @@ def get_llm_with_fallback():
         return get_llm(fallback_model)
 
 
+def warm_up_connection(llm) -> threading.Thread:
+    """
+    Open the HTTPS connection to the Groq API in a background thread.
+    
+    Issues a cheap authenticated request (listing models) through the
+    client's connection pool, so the first real completion reuses a live
+    connection instead of paying DNS + TLS setup. Failures are ignored.
+    
+    Args:
+        llm: ChatGroq instance whose connection pool should be warmed
+    
+    Returns:
+        threading.Thread: The started daemon thread
+    """
+    def warm():
+        try:
+            llm.client._client.models.list()
+        except Exception as e:
+            print(f"Connection warm-up skipped: {e}")
+    
+    thread = threading.Thread(target=warm, daemon=True)
+    thread.start()
+    return thread
+
+
 if __name__ == "__main__":
     # Test the LLM connection
     try:
@@ -6,12 +6,23 @@ import os
 import streamlit as st
 from few_shot import get_tags, get_length_categories, get_languages, get_post_summary
 from post_generator import generate_post, generate_post_with_custom_topic
+from llm_helper import get_llm_with_fallback, warm_up_connection
 
 # Paths for auto-preprocessing
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 RAW_POSTS_PATH = os.path.join(DATA_DIR, "raw_posts.json")
 PROCESSED_POSTS_PATH = os.path.join(DATA_DIR, "processed_posts.json")
 
+# Same escaping as html.escape(), plus newline -> <br>, in a single pass
+HTML_ESCAPE_TABLE = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "'": "&#x27;",
+    "\n": "<br>"
+})
+
 
 def needs_preprocessing():
     """Check if preprocessing is needed (no processed file or raw is newer)."""
@@ -31,6 +42,8 @@ def run_preprocessing():
     with st.spinner("🔄 Preprocessing posts (extracting metadata & unifying tags)..."):
         try:
             preprocess_posts()
+            # Cached dataset views are stale now
+            st.cache_data.clear()
             st.success("✅ Preprocessing complete!")
             st.rerun()
         except Exception as e:
@@ -38,6 +51,41 @@ def run_preprocessing():
             st.stop()
 
 
+# Cached wrappers: Streamlit reruns the whole script on every interaction.
+# Each takes the processed file's mtime as its cache key, so rerunning
+# preprocess.py from the command line invalidates them too.
+@st.cache_data(show_spinner=False)
+def cached_tags(data_version: float):
+    """Get available tags, cached per version of the processed posts."""
+    return get_tags()
+
+
+@st.cache_data(show_spinner=False)
+def cached_languages(data_version: float):
+    """Get available languages, cached per version of the processed posts."""
+    return get_languages()
+
+
+@st.cache_data(show_spinner=False)
+def cached_length_categories(data_version: float):
+    """Get available length categories, cached per version of the processed posts."""
+    return get_length_categories()
+
+
+@st.cache_data(show_spinner=False)
+def cached_post_summary(data_version: float):
+    """Get the dataset summary, cached per version of the processed posts."""
+    return get_post_summary()
+
+
+@st.cache_resource(show_spinner=False)
+def cached_llm():
+    """Create the shared LLM once and warm up its connection in the background."""
+    llm = get_llm_with_fallback()
+    warm_up_connection(llm)
+    return llm
+
+
 # Page configuration
 st.set_page_config(
     page_title="LinkedIn Post Generator",
@@ -60,10 +108,11 @@ if needs_preprocessing():
 
 # Load processed data
 try:
-    tags = get_tags()
-    languages = get_languages()
-    length_categories = get_length_categories()
-    summary = get_post_summary()
+    data_version = os.path.getmtime(PROCESSED_POSTS_PATH)
+    tags = cached_tags(data_version)
+    languages = cached_languages(data_version)
+    length_categories = cached_length_categories(data_version)
+    summary = cached_post_summary(data_version)
     
     # Show dataset info in expander
     with st.expander("Dataset Info"):
@@ -83,6 +132,12 @@ except FileNotFoundError:
     """)
     st.stop()
 
+# Create the LLM early so its connection warms up while the post is configured
+try:
+    cached_llm()
+except ValueError:
+    pass  # Missing API key is reported when generating
+
 # Input section
 st.subheader("Configure Your Post")
 
@@ -137,13 +192,15 @@ if st.button("Generate Post", type="primary", use_container_width=True):
                         custom_topic=topic,
                         length=selected_length,
                         language=selected_language,
-                        reference_tag=selected_topic  # Use selected tag for style reference
+                        reference_tag=selected_topic,  # Use selected tag for style reference
+                        llm=cached_llm()
                     )
                 else:
                     generated_post = generate_post(
                         topic=topic,
                         length=selected_length,
-                        language=selected_language
+                        language=selected_language,
+                        llm=cached_llm()
                     )
                 
                 # Display the result
@@ -152,8 +209,7 @@ if st.button("Generate Post", type="primary", use_container_width=True):
                 st.subheader("Your Generated Post")
                 
                 # Styled post container
-                import html
-                escaped_for_html = html.escape(generated_post).replace('\n', '<br>')
+                escaped_for_html = generated_post.translate(HTML_ESCAPE_TABLE)
                 
                 st.markdown(f"""
                 <div style="
@@ -4,7 +4,7 @@ Constructs prompts with few-shot examples and generates LinkedIn posts.
 """
 from langchain_core.prompts import PromptTemplate
 from llm_helper import get_llm
-from few_shot import get_filtered_posts
+from few_shot import get_filtered_post_texts
 
 
 def create_post_prompt():
@@ -38,32 +38,38 @@ YOUR POST:"""
     )
 
 
-def format_examples(posts: list) -> str:
-    """Format example posts for inclusion in the prompt."""
-    if not posts:
-        return "(No matching examples found - write in a professional, insightful style)"
-    
-    formatted = []
-    for i, post in enumerate(posts, 1):
-        formatted.append(f"--- Example {i} ---\n{post['text']}\n")
+LENGTH_DESCRIPTIONS = {
+    "Short": "4 lines or less - punchy and concise",
+    "Medium": "5-10 lines - balanced depth and brevity",
+    "Long": "11+ lines - comprehensive exploration of the topic"
+}
+
+NO_EXAMPLES_TEXT = "(No matching examples found - write in a professional, insightful style)"
+
+# The template is constant, so build it once and reuse it for every post
+_POST_PROMPT = create_post_prompt()
+
+
+def format_examples(texts: list) -> str:
+    """Format example post texts as numbered examples for inclusion in the prompt."""
+    if not texts:
+        return NO_EXAMPLES_TEXT
     
-    return "\n".join(formatted)
+    return "\n".join(
+        f"--- Example {i} ---\n{text}\n" for i, text in enumerate(texts, 1)
+    )
 
 
 def get_length_description(length: str) -> str:
     """Get a description of the target length."""
-    descriptions = {
-        "Short": "4 lines or less - punchy and concise",
-        "Medium": "5-10 lines - balanced depth and brevity",
-        "Long": "11+ lines - comprehensive exploration of the topic"
-    }
-    return descriptions.get(length, "Medium length")
+    return LENGTH_DESCRIPTIONS.get(length, "Medium length")
 
 
 def generate_post(
     topic: str,
     length: str = "Medium",
-    language: str = "English"
+    language: str = "English",
+    llm=None
 ) -> str:
     """
     Generate a LinkedIn post matching the specified criteria.
@@ -72,12 +78,13 @@ def generate_post(
         topic: The topic/tag to write about
         length: Post length ("Short", "Medium", "Long")
         language: Language ("English", "Hinglish")
+        llm: Optional LLM instance to use instead of get_llm()
     
     Returns:
         str: Generated LinkedIn post
     """
-    # Get few-shot examples matching the criteria
-    example_posts = get_filtered_posts(
+    # Get few-shot example texts matching the criteria
+    example_texts = get_filtered_post_texts(
         length=length,
         language=language,
         tag=topic,
@@ -85,12 +92,13 @@ def generate_post(
     )
     
     # Format examples for the prompt
-    examples_text = format_examples(example_posts)
+    examples_text = format_examples(example_texts)
     length_description = get_length_description(length)
     
     # Create and invoke the chain
-    prompt = create_post_prompt()
-    llm = get_llm()
+    prompt = _POST_PROMPT
+    if llm is None:
+        llm = get_llm()
     
     chain = prompt | llm
     
@@ -109,7 +117,8 @@ def generate_post_with_custom_topic(
     custom_topic: str,
     length: str = "Medium",
     language: str = "English",
-    reference_tag: str = None
+    reference_tag: str = None,
+    llm=None
 ) -> str:
     """
     Generate a post with a custom topic (not from predefined tags).
@@ -119,13 +128,14 @@ def generate_post_with_custom_topic(
         length: Post length
         language: Language
         reference_tag: Optional tag to use for fetching style examples
+        llm: Optional LLM instance to use instead of get_llm()
     
     Returns:
         str: Generated LinkedIn post
     """
     # Get examples based on reference tag or general high-engagement posts
     if reference_tag:
-        example_posts = get_filtered_posts(
+        example_texts = get_filtered_post_texts(
             length=length,
             language=language,
             tag=reference_tag,
@@ -133,17 +143,18 @@ def generate_post_with_custom_topic(
         )
     else:
         # Get top posts by engagement regardless of tag
-        example_posts = get_filtered_posts(
+        example_texts = get_filtered_post_texts(
             length=length,
             language=language,
             max_results=3
         )
     
-    examples_text = format_examples(example_posts)
+    examples_text = format_examples(example_texts)
     length_description = get_length_description(length)
     
-    prompt = create_post_prompt()
-    llm = get_llm()
+    prompt = _POST_PROMPT
+    if llm is None:
+        llm = get_llm()
     
     chain = prompt | llm
     
@@ -3,40 +3,106 @@ Preprocessing Module
 Enriches raw LinkedIn posts with metadata (line count, language, tags)
 and unifies tags to a standardized list.
 """
+import argparse
+import asyncio
+import functools
+import hashlib
 import json
 import os
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from llm_helper import get_llm
+import random
+import re
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import groq
+import pandas as pd
+from langchain_core.language_models import BaseChatModel
+from llm_helper import aclose_llm, get_llm
+from few_shot import save_post_summary
+
+try:
+    import ijson
+except ImportError:  # Optional: fall back to loading the whole file
+    ijson = None
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the stdlib json module
+    orjson = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional: off-list tags then map straight to "Other"
+    SentenceTransformer = None
 
 # Paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 RAW_POSTS_PATH = os.path.join(DATA_DIR, "raw_posts.json")
 PROCESSED_POSTS_PATH = os.path.join(DATA_DIR, "processed_posts.json")
 
+# Maximum number of metadata requests in flight at once (provider rate limits)
+MAX_CONCURRENT_REQUESTS = 8
 
-def load_raw_posts():
-    """Load raw posts from JSON file."""
-    with open(RAW_POSTS_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Number of posts packed into a single metadata request
+METADATA_BATCH_SIZE = 6
 
+# On-disk cache of LLM metadata, keyed by post-text hash
+METADATA_CACHE_PATH = os.path.join(DATA_DIR, "metadata_cache.sqlite")
+# Bump when the metadata prompts change so stale cached results are not reused
+METADATA_PROMPT_VERSION = "3"
 
-def count_lines(text: str) -> int:
-    """Count non-empty lines in text."""
-    lines = [line for line in text.split("\n") if line.strip()]
-    return len(lines)
+# Closed tag vocabulary the metadata prompts must choose from
+PREFERRED_CATEGORIES = [
+    "Causal AI",
+    "Machine Learning",
+    "Financial Engineering",
+    "Quantitative Finance",
+    "System Design",
+    "Data Engineering",
+    "Statistics",
+    "Programming"
+]
+# Tag for posts that fit none of the preferred categories
+OTHER_TAG = "Other"
+
+# Local embedding model used to map off-list tags onto the vocabulary
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Minimum cosine similarity for mapping a tag onto a preferred category
+TAG_SIMILARITY_THRESHOLD = 0.55
+
+# Metadata of finished posts, appended as a run progresses so an
+# interrupted run can resume; removed once processed_posts.json is saved
+CHECKPOINT_PATH = os.path.join(DATA_DIR, "processed_posts.jsonl")
+
+# Attempts per LLM call; transient errors are retried with exponential backoff
+MAX_LLM_ATTEMPTS = 3
 
+# API errors worth retrying: rate limits, timeouts, dropped connections, outages
+# (APITimeoutError is a subclass of APIConnectionError)
+TRANSIENT_LLM_ERRORS = (
+    groq.RateLimitError,
+    groq.APIConnectionError,
+    groq.InternalServerError
+)
 
-def extract_metadata_prompt():
-    """Create prompt template for metadata extraction."""
-    template = """Analyze the following LinkedIn post and extract metadata.
+# Metadata used when extraction fails; never written to the cache
+FALLBACK_METADATA = {
+    "language": "English",
+    "tags": [OTHER_TAG]
+}
+
+
+# Metadata prompts, filled with str.format on the hot path
+META_TEMPLATE = """Analyze the following LinkedIn post and extract metadata.
 
 POST:
 {post_text}
 
 Return a JSON object with the following fields:
 - "language": Either "English" or "Hinglish" (Hindi+English mix)
-- "tags": A list of 2-4 relevant topic tags (e.g., "Causal AI", "Machine Learning", "Financial Engineering", "System Design", "Quantitative Finance", "Statistics", "Trading", "Data Engineering")
+- "tags": A list of 1-4 relevant topic tags. Tags MUST be chosen from this list (one per line):
+{categories}
+  If none of them fit, use "Other".
 
 Return ONLY the JSON object, no additional text.
 
@@ -44,152 +110,780 @@ Example output:
 {{"language": "English", "tags": ["Machine Learning", "Causal AI"]}}
 
 JSON Output:"""
+
+BATCH_META_TEMPLATE = """Analyze each of the following LinkedIn posts and extract metadata.
+
+{posts}
+
+For EACH post, return a JSON object with the following fields:
+- "language": Either "English" or "Hinglish" (Hindi+English mix)
+- "tags": A list of 1-4 relevant topic tags. Tags MUST be chosen from this list (one per line):
+{categories}
+  If none of them fit, use "Other".
+
+Return ONLY a JSON array with exactly {post_count} objects, one per post, in the same order as the posts. No additional text.
+
+Example output for 2 posts:
+[{{"language": "English", "tags": ["Machine Learning", "Causal AI"]}}, {{"language": "Hinglish", "tags": ["Quantitative Finance"]}}]
+
+JSON Output:"""
+
+# The vocabulary as it is embedded in the metadata prompts: one name per
+# line is cheaper in input tokens than a quoted, comma-separated list
+CATEGORIES_TEXT = "\n".join(PREFERRED_CATEGORIES)
+
+# Start of a line holding at least one non-whitespace character
+_NONEMPTY_LINE = re.compile(r"^[^\S\n]*\S", re.MULTILINE)
+
+# Runs of characters that are not letters or digits (tag canonicalization)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Optional ```json ... ``` fence around a model's JSON answer
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+
+
+def load_raw_posts():
+    """Load raw posts from JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(RAW_POSTS_PATH, "rb") as f:
+            return orjson.loads(f.read())
     
-    return PromptTemplate(
-        input_variables=["post_text"],
-        template=template
-    )
+    with open(RAW_POSTS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 
-def unify_tags_prompt():
-    """Create prompt template for tag unification."""
-    template = """You are given a list of tags extracted from LinkedIn posts. 
-Many tags are similar but worded differently.
+def dump_post(post: dict, pretty: bool = False) -> str:
+    """Serialize one post to JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(post, option=orjson.OPT_INDENT_2 if pretty else 0).decode("utf-8")
+    return json.dumps(post, indent=2 if pretty else None, ensure_ascii=False)
 
-ALL EXTRACTED TAGS:
-{all_tags}
 
-Create a mapping that standardizes these tags into a unified list. 
-Group similar concepts together and pick the best representative name.
+def save_processed_posts(posts, pretty: bool = False) -> int:
+    """
+    Write processed posts to a JSON array, one post at a time.
+    
+    Posts are serialized as they are drawn from the iterable, so the full
+    list never has to be held in memory. The file is written to a
+    temporary path and then renamed, so a crash mid-write never leaves a
+    truncated file behind.
+    
+    Args:
+        posts: Iterable of enriched posts to save
+        pretty: Indent the output for human inspection
+    
+    Returns:
+        int: Number of posts written
+    """
+    tmp_path = PROCESSED_POSTS_PATH + ".tmp"
+    count = 0
+    
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for post in posts:
+            if count:
+                f.write(",")
+            if pretty:
+                # Nest each post's lines one level inside the array
+                f.write("\n  " + dump_post(post, pretty=True).replace("\n", "\n  "))
+            else:
+                f.write(dump_post(post))
+            count += 1
+        if pretty and count:
+            f.write("\n")
+        f.write("]\n")
+    
+    os.replace(tmp_path, PROCESSED_POSTS_PATH)
+    return count
+
 
-Return a JSON object where:
-- Keys are the original tags
-- Values are the standardized tag names
+def iter_raw_posts():
+    """
+    Yield raw posts one at a time.
+    
+    Streams the JSON array with ijson when it is installed, so the full
+    archive never has to be held in memory at once.
+    """
+    if ijson is None:
+        yield from load_raw_posts()
+        return
+    
+    with open(RAW_POSTS_PATH, "rb") as f:
+        yield from ijson.items(f, "item", use_float=True)
 
-Use these preferred standardized categories when applicable:
-- "Causal AI" (for causal inference, causal ML, etc.)
-- "Machine Learning" (for ML, predictive modeling, etc.)
-- "Financial Engineering" (for derivatives, options, volatility, etc.)
-- "Quantitative Finance" (for quant, trading strategies, alpha, etc.)
-- "System Design" (for architecture, data pipelines, etc.)
-- "Data Engineering" (for data processing, databases, etc.)
-- "Statistics" (for econometrics, statistical methods, etc.)
-- "Programming" (for Python, C++, Rust, coding, etc.)
 
-Return ONLY the JSON mapping object.
+def count_lines(text: str) -> int:
+    """Count non-empty lines in text."""
+    return len(_NONEMPTY_LINE.findall(text))
 
-JSON Output:"""
+
+def post_hash(post_text: str) -> str:
+    """Hash a post's text (and the prompt version) into a metadata cache key."""
+    key = f"{METADATA_PROMPT_VERSION}\0{post_text}".encode("utf-8")
+    return hashlib.blake2b(key, digest_size=16).hexdigest()
+
+
+def open_metadata_cache(path: str = METADATA_CACHE_PATH) -> sqlite3.Connection:
+    """Open (creating if needed) the SQLite metadata cache."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (hash TEXT PRIMARY KEY, json TEXT)")
+    return conn
+
+
+def get_cached_metadata(conn: sqlite3.Connection, post_text: str):
+    """Return cached metadata for a post, or None on a cache miss."""
+    row = conn.execute(
+        "SELECT json FROM meta WHERE hash = ?", (post_hash(post_text),)
+    ).fetchone()
+    if row is None:
+        return None
+    metadata = json.loads(row[0])
+    # Malformed entries stored before replies were validated count as misses
+    return metadata if _is_metadata(metadata) else None
+
+
+def cache_metadata(conn: sqlite3.Connection, post_text: str, metadata: dict):
+    """Store metadata for a post; fallback metadata is skipped."""
+    if metadata is FALLBACK_METADATA:
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (hash, json) VALUES (?, ?)",
+        (post_hash(post_text), json.dumps(metadata, ensure_ascii=False))
+    )
+
+
+def load_checkpoint(path: str = CHECKPOINT_PATH) -> dict:
+    """
+    Read metadata saved by an interrupted run.
+    
+    Returns:
+        dict: Mapping of post hash -> metadata (empty if there is no checkpoint)
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
     
-    return PromptTemplate(
-        input_variables=["all_tags"],
-        template=template
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Partial last line from a crash
+            metadata = {
+                "language": record.get("language"),
+                "tags": record.get("tags")
+            }
+            if _is_metadata(metadata):  # Malformed records are extracted again
+                done[record["hash"]] = metadata
+    
+    return done
+
+
+def open_checkpoint(path: str = CHECKPOINT_PATH):
+    """
+    Open the checkpoint for appending.
+    
+    If a crash left a partial last line, a newline is written first so the
+    next record starts on a line of its own instead of being appended to
+    the torn one (which load_checkpoint() skips).
+    """
+    torn = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+    
+    f = open(path, "a", encoding="utf-8")
+    if torn:
+        f.write("\n")
+    return f
+
+
+def append_checkpoint(f, post_texts: list, all_metadata: list):
+    """Durably append metadata for finished posts; fallback metadata is skipped."""
+    for post_text, metadata in zip(post_texts, all_metadata):
+        if metadata is FALLBACK_METADATA:
+            continue
+        record = {
+            "hash": post_hash(post_text),
+            "language": metadata.get("language", "English"),
+            "tags": metadata.get("tags", [])
+        }
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def format_posts_for_batch(post_texts: list) -> str:
+    """Number posts as POST [1], POST [2], ... for a batch prompt."""
+    return "\n\n".join(
+        f"POST [{i}]:\n{text}" for i, text in enumerate(post_texts, 1)
     )
 
 
-def extract_metadata_for_post(llm, post_text: str) -> dict:
-    """Extract metadata for a single post using LLM."""
-    prompt = extract_metadata_prompt()
-    parser = JsonOutputParser()
+def parse_json_response(content: str):
+    """Parse JSON from an LLM response, tolerating a Markdown code fence."""
+    content = content.strip()
+    match = _CODE_FENCE.match(content)
+    if match:
+        content = match.group(1)
+    return json.loads(content)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Check whether a failed LLM call may succeed if retried."""
+    if isinstance(error, TRANSIENT_LLM_ERRORS):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+def retry_delay(attempt: int) -> float:
+    """Seconds to wait before retrying: exponential backoff plus jitter."""
+    return 2 ** attempt + random.random()
+
+
+def has_native_async(llm) -> bool:
+    """
+    Check whether the client implements async calls itself.
+    
+    Every LangChain model has ainvoke(), but a chat model that does not
+    override _agenerate() just runs its blocking call on an executor.
+    """
+    if not hasattr(llm, "ainvoke"):
+        return False
+    if isinstance(llm, BaseChatModel):
+        return type(llm)._agenerate is not BaseChatModel._agenerate
+    return True
+
+
+async def ainvoke_llm(llm, prompt: str):
+    """
+    Invoke the LLM without blocking the event loop.
+    
+    Uses the client's native async API when it has one; blocking-only
+    clients are run on the event loop's default executor instead.
+    """
+    if has_native_async(llm):
+        return await llm.ainvoke(prompt)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, llm.invoke, prompt)
+
+
+async def ainvoke_with_retry(llm, prompt: str, stats: Counter = None):
+    """
+    Invoke the LLM, retrying transient failures (rate limits, timeouts,
+    dropped connections, server errors) up to MAX_LLM_ATTEMPTS times.
     
-    chain = prompt | llm | parser
+    Any other error (bad API key, oversized request, a bug) is raised at
+    once. The Groq client makes its own retries beneath each attempt.
+    
+    Args:
+        llm: LLM instance
+        prompt: Prompt text
+        stats: Optional counter; incremented under "retries" per retry
+    """
+    for attempt in range(MAX_LLM_ATTEMPTS):
+        try:
+            return await ainvoke_llm(llm, prompt)
+        except Exception as e:
+            if attempt == MAX_LLM_ATTEMPTS - 1 or not is_transient_error(e):
+                raise
+            delay = retry_delay(attempt)
+            print(f"LLM call failed ({e}), retrying in {delay:.1f}s...")
+            if stats is not None:
+                stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+
+async def aextract_metadata_for_post(llm, post_text: str, stats: Counter = None) -> dict:
+    """Extract metadata for a single post using the LLM's async API."""
+    prompt = META_TEMPLATE.format(post_text=post_text, categories=CATEGORIES_TEXT)
     
     try:
-        result = chain.invoke({"post_text": post_text})
-        return result
+        response = await ainvoke_with_retry(llm, prompt, stats)
     except Exception as e:
         print(f"Error extracting metadata: {e}")
         # Fallback to basic metadata
-        return {
-            "language": "English",
-            "tags": ["General"]
-        }
+        return FALLBACK_METADATA
+    
+    try:
+        result = parse_json_response(response.content)
+    except ValueError:
+        result = None
+    if _is_metadata(result):
+        return result
+    
+    # Retrying the same prompt rarely fixes malformed output
+    print(f"Could not parse metadata response: {response.content!r}")
+    return FALLBACK_METADATA
 
 
-def unify_all_tags(llm, all_tags: list) -> dict:
-    """Create a mapping to unify all tags to standardized names."""
-    prompt = unify_tags_prompt()
-    parser = JsonOutputParser()
+async def aextract_metadata_for_batch(llm, post_texts: list, stats: Counter = None) -> list:
+    """
+    Extract metadata for several posts with a single LLM call.
     
-    chain = prompt | llm | parser
+    If the batch request is rejected, or its response cannot be parsed or
+    does not contain one result per post, the posts are retried one at a
+    time. If it still fails transiently after every retry, all posts get
+    FALLBACK_METADATA without further calls.
     
-    unique_tags = list(set(all_tags))
+    Returns:
+        list: Metadata dicts, in the same order as post_texts
+    """
+    if len(post_texts) == 1:
+        return [await aextract_metadata_for_post(llm, post_texts[0], stats)]
+    
+    prompt = BATCH_META_TEMPLATE.format(
+        posts=format_posts_for_batch(post_texts),
+        post_count=len(post_texts),
+        categories=CATEGORIES_TEXT
+    )
     
     try:
-        result = chain.invoke({"all_tags": json.dumps(unique_tags)})
-        return result
+        response = await ainvoke_with_retry(llm, prompt, stats)
     except Exception as e:
-        print(f"Error unifying tags: {e}")
-        # Return identity mapping as fallback
-        return {tag: tag for tag in unique_tags}
+        if is_transient_error(e):
+            print(f"Error extracting batch metadata ({e}), using fallback metadata...")
+            return [FALLBACK_METADATA] * len(post_texts)
+        print(f"Error extracting batch metadata ({e}), retrying individually...")
+    else:
+        try:
+            result = parse_json_response(response.content)
+        except ValueError:
+            result = None
+        if _is_batch_result(result, len(post_texts)):
+            return result
+        print(f"Batch response did not match {len(post_texts)} posts, retrying individually: {response.content!r}")
+    
+    # One at a time, so the batch still holds a single request slot
+    return [await aextract_metadata_for_post(llm, text, stats) for text in post_texts]
 
 
-def preprocess_posts():
-    """Main preprocessing pipeline."""
-    print("Loading raw posts...")
-    raw_posts = load_raw_posts()
-    print(f"Loaded {len(raw_posts)} posts")
+def _is_metadata(result) -> bool:
+    """Check that a parsed response holds a language string and a list of tag strings."""
+    return (
+        isinstance(result, dict)
+        and isinstance(result.get("language"), str)
+        and isinstance(result.get("tags"), list)
+        and all(isinstance(tag, str) for tag in result["tags"])
+    )
+
+
+def _is_batch_result(result, post_count: int) -> bool:
+    """Check that a batch response holds one metadata object per post."""
+    return (
+        isinstance(result, list)
+        and len(result) == post_count
+        and all(_is_metadata(item) for item in result)
+    )
+
+
+async def extract_metadata_concurrently(
+    llm,
+    post_texts,
+    on_batch,
+    max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+    batch_size: int = METADATA_BATCH_SIZE,
+    cache: sqlite3.Connection = None,
+    stats: Counter = None
+):
+    """
+    Extract metadata for a stream of posts concurrently.
     
-    print("\nInitializing LLM...")
-    llm = get_llm()
+    Posts are read lazily and handed to a fixed pool of workers through a
+    bounded queue, so only a few batches are held in memory at a time.
+    Results are delivered through on_batch as they complete rather than
+    returned.
     
-    # Step 1: Extract metadata for each post
-    print("\n--- Step 1: Extracting metadata ---")
-    all_tags = []
-    enriched_posts = []
+    Args:
+        llm: LLM instance
+        post_texts: Iterable of post texts to analyze
+        on_batch: Callback(batch_texts, batch_metadata) run as each batch
+                  completes, including batches served from the cache
+        max_concurrent: Maximum number of requests in flight at once
+        batch_size: Number of posts packed into each request
+        cache: Optional metadata cache connection; hits skip the LLM and
+               new results are stored as each batch completes
+        stats: Optional counter of where metadata came from ("llm",
+               "cache", "fallback") and how many calls were retried
+    """
+    if stats is None:
+        stats = Counter()
+    
+    if not has_native_async(llm):
+        # Blocking-only client: give ainvoke_llm() one worker thread per slot
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=max_concurrent)
+        )
+    print(f"Sending requests of up to {batch_size} posts ({max_concurrent} at a time)...")
+    
+    # A couple of batches per worker keeps them busy without reading ahead
+    queue = asyncio.Queue(maxsize=2 * max_concurrent)
     
-    for i, post in enumerate(raw_posts):
-        print(f"Processing post {i+1}/{len(raw_posts)}...")
+    async def produce():
+        batch = []
+        cached_texts, cached_metadata = [], []
         
-        text = post["text"]
-        line_count = count_lines(text)
+        for text in post_texts:
+            metadata = get_cached_metadata(cache, text) if cache is not None else None
+            if metadata is None:
+                batch.append(text)
+                if len(batch) == batch_size:
+                    await queue.put(batch)
+                    batch = []
+                continue
+            
+            stats["cache"] += 1
+            cached_texts.append(text)
+            cached_metadata.append(metadata)
+            if len(cached_texts) == batch_size:
+                on_batch(cached_texts, cached_metadata)
+                cached_texts, cached_metadata = [], []
         
-        # Get metadata from LLM
-        metadata = extract_metadata_for_post(llm, text)
+        if cached_texts:
+            on_batch(cached_texts, cached_metadata)
+        if batch:
+            await queue.put(batch)
+        for _ in range(max_concurrent):
+            await queue.put(None)  # One stop signal per worker
+    
+    async def consume():
+        while True:
+            batch_texts = await queue.get()
+            if batch_texts is None:
+                return
+            batch_result = await aextract_metadata_for_batch(llm, batch_texts, stats)
+            
+            for text, metadata in zip(batch_texts, batch_result):
+                if cache is not None:
+                    cache_metadata(cache, text, metadata)
+                stats["fallback" if metadata is FALLBACK_METADATA else "llm"] += 1
+            
+            on_batch(batch_texts, batch_result)
+    
+    await asyncio.gather(produce(), *(consume() for _ in range(max_concurrent)))
+
+
+@functools.lru_cache(maxsize=1)
+def _load_tag_embedder():
+    """Load the embedding model and embed the preferred categories (once)."""
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    category_embeddings = model.encode(PREFERRED_CATEGORIES, normalize_embeddings=True)
+    return model, category_embeddings
+
+
+def unify_tags_with_embeddings(all_tags: list) -> dict:
+    """
+    Map tags onto the preferred categories by embedding similarity.
+    
+    Each unique tag is embedded once and assigned to the most similar
+    preferred category; tags below TAG_SIMILARITY_THRESHOLD map to "Other".
+    
+    Returns:
+        dict: Mapping of original tag -> standardized tag
+    """
+    unique_tags = sorted(set(all_tags))
+    if not unique_tags:
+        return {}
+    
+    model, category_embeddings = _load_tag_embedder()
+    tag_embeddings = model.encode(unique_tags, normalize_embeddings=True, batch_size=64)
+    
+    # Normalized embeddings: the dot product is the cosine similarity
+    similarities = tag_embeddings @ category_embeddings.T
+    best = similarities.argmax(axis=1)
+    
+    mapping = {}
+    for row, (tag, category) in enumerate(zip(unique_tags, best)):
+        if similarities[row, category] >= TAG_SIMILARITY_THRESHOLD:
+            mapping[tag] = PREFERRED_CATEGORIES[category]
+        else:
+            mapping[tag] = OTHER_TAG
+    
+    return mapping
+
+
+def canonicalize_tag(tag: str) -> str:
+    """
+    Reduce a tag to a comparison key.
+    
+    Lowercases, replaces punctuation with spaces, collapses whitespace and
+    naively singularizes each word, so "Machine-Learning" and
+    "machine learnings" share a key.
+    """
+    words = _NON_ALNUM.sub(" ", tag.lower()).split()
+    return " ".join(
+        word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+        for word in words
+    )
+
+
+# Canonical key -> vocabulary tag, for exact matches after canonicalization
+_PREFERRED_BY_KEY = {
+    canonicalize_tag(category): category
+    for category in PREFERRED_CATEGORIES + [OTHER_TAG]
+}
+
+
+def unify_all_tags(all_tags: list) -> dict:
+    """
+    Map extracted tags onto the closed tag vocabulary, without an LLM call.
+    
+    The metadata prompts already ask for vocabulary tags, so this only
+    catches model drift. Tags that only differ from a vocabulary tag in
+    case, punctuation, spacing or plural form map to it directly; anything
+    else is matched by embedding similarity when sentence-transformers is
+    installed, and becomes "Other" otherwise.
+    
+    Returns:
+        dict: Mapping of original tag -> vocabulary tag
+    """
+    # Canonical key -> original spellings (deduplicated, first seen first)
+    variants = {}
+    for tag in all_tags:
+        variants.setdefault(canonicalize_tag(tag), {})[tag] = None
+    
+    drifted = {
+        key: next(iter(originals))
+        for key, originals in variants.items()
+        if key not in _PREFERRED_BY_KEY
+    }
+    if drifted:
+        print(f"{len(drifted)} tags outside the vocabulary: {sorted(drifted.values())}")
+    
+    unified = {}
+    if drifted and SentenceTransformer is not None:
+        try:
+            unified = unify_tags_with_embeddings(list(drifted.values()))
+        except Exception as e:
+            print(f"Embedding-based unification failed ({e}), using \"{OTHER_TAG}\"...")
+    
+    mapping = {}
+    for key, originals in variants.items():
+        if key in _PREFERRED_BY_KEY:
+            target = _PREFERRED_BY_KEY[key]
+        else:
+            target = unified.get(drifted[key], OTHER_TAG)
+        for tag in originals:
+            mapping[tag] = target
+    
+    return mapping
+
+
+def iter_pending_texts(done: dict):
+    """
+    Yield the text of each distinct raw post that still needs metadata.
+    
+    Identical posts (e.g. reposts) share one extraction, and posts already
+    in the checkpoint are skipped. Only hashes are kept to track them.
+    
+    Args:
+        done: Mapping of post hash -> metadata for finished posts
+    """
+    seen = set(done)
+    for post in iter_raw_posts():
+        key = post_hash(post["text"])
+        if key not in seen:
+            seen.add(key)
+            yield post["text"]
+
+
+def apply_tag_mapping(metadata_by_hash: dict, tag_mapping: dict):
+    """
+    Replace each post's tags with their unified form, in place.
+    
+    Applied across all distinct posts at once; unique() removes duplicates
+    per post while preserving order.
+    """
+    keys = list(metadata_by_hash)
+    tags = pd.Series([metadata_by_hash[key]["tags"] for key in keys], dtype=object).explode().dropna()
+    unified = tags.map(tag_mapping).fillna(tags)
+    unified_by_post = unified.groupby(level=0, sort=False).unique()
+    
+    for i, key in enumerate(keys):
+        post_tags = unified_by_post.get(i)
+        metadata_by_hash[key]["tags"] = post_tags.tolist() if post_tags is not None else []
+
+
+def iter_enriched_posts(metadata_by_hash: dict):
+    """
+    Yield raw posts joined with their metadata, in input order.
+    
+    Posts missing from metadata_by_hash (extraction failed) get
+    FALLBACK_METADATA.
+    """
+    for i, post in enumerate(iter_raw_posts(), 1):
+        text = post["text"]
+        metadata = metadata_by_hash.get(post_hash(text), FALLBACK_METADATA)
         
         enriched_post = {
             "text": text,
             "engagement": post.get("engagement", 0),
-            "line_count": line_count,
+            "line_count": count_lines(text),
             "language": metadata.get("language", "English"),
             "tags": metadata.get("tags", [])
         }
         
-        enriched_posts.append(enriched_post)
-        all_tags.extend(enriched_post["tags"])
+        print(
+            f"Post {i}: Lines: {enriched_post['line_count']}, "
+            f"Language: {enriched_post['language']}, Tags: {enriched_post['tags']}"
+        )
+        yield enriched_post
+
+
+def iter_numeric_posts():
+    """
+    Yield raw posts with only their numeric fields filled in.
+    
+    Skips the LLM entirely: language is None and tags are empty.
+    Non-empty lines are counted for the whole corpus in one vectorized
+    pass.
+    """
+    df = pd.DataFrame.from_records(
+        ({"text": post["text"], "engagement": post.get("engagement", 0)} for post in iter_raw_posts()),
+        columns=["text", "engagement"]
+    )
+    df["line_count"] = df["text"].str.count(_NONEMPTY_LINE.pattern, flags=re.MULTILINE)
+    df["language"] = None
+    df["tags"] = [[] for _ in range(len(df))]
+    
+    yield from df.to_dict("records")
+
+
+def preprocess_posts(
+    max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+    batch_size: int = METADATA_BATCH_SIZE,
+    pretty: bool = False,
+    enrich_metadata: bool = True
+):
+    """
+    Main preprocessing pipeline.
+    
+    Raw posts are streamed twice: once into the LLM, whose results are
+    appended to the checkpoint as they arrive, and once more to join them
+    with that metadata while writing processed_posts.json. Only post
+    hashes and metadata are held in memory, never the full corpus.
+    
+    Args:
+        max_concurrent: Maximum number of metadata requests in flight at once
+        batch_size: Number of posts packed into each metadata request
+        pretty: Indent processed_posts.json for human inspection
+        enrich_metadata: Extract language and tags with the LLM; when False
+                         only line counts are computed and no LLM calls
+                         are made
+    
+    Returns:
+        int: Number of posts processed
+    """
+    if not enrich_metadata:
+        print("Skipping metadata enrichment: computing line counts only...")
+        post_count = save_processed_posts(iter_numeric_posts(), pretty=pretty)
+        print(f"Saved {post_count} posts to {PROCESSED_POSTS_PATH}")
         
-        print(f"  Lines: {line_count}, Language: {enriched_post['language']}, Tags: {enriched_post['tags']}")
+        save_post_summary()
+        return post_count
+    
+    print("\nInitializing LLM...")
+    # One client for the whole run, with a keep-alive slot per concurrent request
+    llm = get_llm(pool_size=max_concurrent)
+    
+    # Step 1: Extract metadata for all posts concurrently
+    print("\n--- Step 1: Extracting metadata ---")
     
-    # Step 2: Unify tags
-    print("\n--- Step 2: Unifying tags ---")
-    print(f"Found {len(set(all_tags))} unique tags before unification")
+    # Resume from the checkpoint of an interrupted run, if any
+    done = load_checkpoint()
+    if done:
+        print(f"Resuming: {len(done)} posts restored from {CHECKPOINT_PATH}")
+    # Where each post's metadata came from, reported once the run completes
+    stats = Counter(checkpoint=len(done))
     
-    tag_mapping = unify_all_tags(llm, all_tags)
+    # Tag frequencies, accumulated as results stream in
+    tag_counts = Counter()
+    for metadata in done.values():
+        tag_counts.update(metadata["tags"])
+    
+    cache = open_metadata_cache()
+    try:
+        with open_checkpoint() as checkpoint_file:
+            def on_batch(texts, all_metadata):
+                append_checkpoint(checkpoint_file, texts, all_metadata)
+                for metadata in all_metadata:
+                    tag_counts.update(metadata.get("tags", []))
+            
+            async def extract():
+                try:
+                    await extract_metadata_concurrently(
+                        llm,
+                        iter_pending_texts(done),
+                        on_batch,
+                        max_concurrent=max_concurrent,
+                        batch_size=batch_size,
+                        cache=cache,
+                        stats=stats
+                    )
+                finally:
+                    # The pools belong to this run (and this event loop)
+                    await aclose_llm(llm)
+            
+            asyncio.run(extract())
+    finally:
+        cache.close()
+    
+    # Step 2: Normalize tags locally (the prompts already constrain them)
+    print("\n--- Step 2: Normalizing tags ---")
+    print(f"Found {len(tag_counts)} unique tags")
+    
+    tag_mapping = unify_all_tags(sorted(tag_counts))
     print(f"Tag mapping created: {json.dumps(tag_mapping, indent=2)}")
     
-    # Apply unified tags
-    for post in enriched_posts:
-        post["tags"] = [tag_mapping.get(tag, tag) for tag in post["tags"]]
-        # Remove duplicates while preserving order
-        post["tags"] = list(dict.fromkeys(post["tags"]))
+    # The checkpoint now holds metadata for every post that did not fall back
+    metadata_by_hash = load_checkpoint()
+    apply_tag_mapping(metadata_by_hash, tag_mapping)
     
     # Step 3: Save processed posts
     print("\n--- Step 3: Saving processed posts ---")
-    with open(PROCESSED_POSTS_PATH, "w", encoding="utf-8") as f:
-        json.dump(enriched_posts, f, indent=2, ensure_ascii=False)
+    post_count = save_processed_posts(iter_enriched_posts(metadata_by_hash), pretty=pretty)
     
     print(f"Saved to {PROCESSED_POSTS_PATH}")
     
+    # The run is complete, so the checkpoint is no longer needed
+    os.remove(CHECKPOINT_PATH)
+    
+    # Precompute the dataset summary (this also writes the Parquet sidecar)
+    save_post_summary()
+    
     # Summary
-    final_tags = set()
-    for post in enriched_posts:
-        final_tags.update(post["tags"])
+    final_tags = {tag_mapping.get(tag, tag) for tag in tag_counts}
     
     print(f"\n=== Preprocessing Complete ===")
-    print(f"Total posts processed: {len(enriched_posts)}")
+    print(f"Total posts processed: {post_count}")
     print(f"Unified tags: {sorted(final_tags)}")
+    print(
+        f"Metadata sources: {stats['llm']} from the LLM, {stats['cache']} from the cache, "
+        f"{stats['checkpoint']} from the checkpoint, {stats['fallback']} fallback "
+        f"({stats['retries']} retried calls)"
+    )
     
-    return enriched_posts
+    return post_count
 
 
 if __name__ == "__main__":
-    preprocess_posts()
+    parser = argparse.ArgumentParser(description="Enrich raw LinkedIn posts with metadata.")
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Indent processed_posts.json for human inspection"
+    )
+    parser.add_argument(
+        "--enrich-metadata",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Extract language and tags with the LLM (--no-enrich-metadata only counts lines)"
+    )
+    args = parser.parse_args()
+    
+    preprocess_posts(pretty=args.pretty, enrich_metadata=args.enrich_metadata)